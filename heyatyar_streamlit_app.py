@@ -4,12 +4,32 @@ import sqlite3
 import pandas as pd
 from dotenv import load_dotenv
 import re
-import time # Import time for sleep
-from litellm import completion, RateLimitError # Import RateLimitError
+import queue
+import threading
+from contextlib import contextmanager
+import sqlglot
+from sqlglot import exp
+from llm_cache import LLMResponseError, cache_key, cached_completion, load_response_cache, store_response
+from semantic_cache import get_semantic_cache
 
 # Load environment variables from a .env file (if it exists).
 load_dotenv()
 
+# Precompiled patterns for parsing AI answers
+_SQL_BLOCK_RE = re.compile(r"```sql\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_SQL_VERB_RE = re.compile(r"^\s*(select|insert|update|delete)\b", re.IGNORECASE)
+
+database = "company.db"
+
+# Maximum number of rows an AI-generated SELECT may return
+MAX_AI_ROWS = 10000
+# AI results up to this size are rendered as a static table instead of an interactive grid
+SMALL_RESULT_ROWS = 50
+SMALL_RESULT_COLS = 4
+
+# Columns of the EMPLOYEE table, in table order
+EMPLOYEE_COLS = ("ID", "NAME", "SALARY", "AGE", "GENDER", "DESIGNATION", "WORKING_HOURS", "MONTHLY_LUNCH_BILL", "BONUS")
+
 # --- Simple Password Protection ---
 PASSWORD = '82508250'  # Change this to your desired password
 if "authenticated" not in st.session_state:
@@ -22,55 +42,134 @@ if not st.session_state["authenticated"]:
         if password_input == PASSWORD:
             st.session_state["authenticated"] = True
             st.success("Access granted!")
-            st.experimental_rerun()
+            st.rerun()
         else:
             st.error("Incorrect password. Try again.")
     st.stop()
 # --- Database Functions ---
 
 def create_connection(db_file):
-    """Create a database connection to the SQLite database specified by db_file."""
+    """
+    Create a database connection to the SQLite database specified by db_file.
+    The connection runs in autocommit mode and may be shared between Streamlit script threads.
+    WAL journaling and a larger page cache are enabled, and rows are returned as sqlite3.Row.
+    The EMPLOYEE table and its NAME index are created if they don't exist yet.
+    """
     conn = None
     try:
-        conn = sqlite3.connect(db_file)
+        conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute(""" CREATE TABLE IF NOT EXISTS EMPLOYEE(
+                             ID INTEGER PRIMARY KEY AUTOINCREMENT, NAME VARCHAR(50), SALARY REAL, AGE INT,
+                             GENDER VARCHAR(10), DESIGNATION VARCHAR(50), WORKING_HOURS INT,
+                             MONTHLY_LUNCH_BILL REAL, BONUS REAL) """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_name ON EMPLOYEE(NAME)")
+        conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.Error as e:
         st.error(f"Error connecting to database: {e}")
         return None
 
 
+@st.cache_resource
+def get_conn(db_file):
+    """Return a single connection to db_file, reused across reruns and sessions."""
+    return create_connection(db_file)
+
+
+def create_readonly_connection(db_file):
+    """Create a read-only connection to db_file. Raises sqlite3.Error if the database can't be opened."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@st.cache_resource
+def get_reader_pool(db_file):
+    """
+    Return a pool of read-only connections to db_file, one per CPU.
+    Under WAL they read concurrently with each other and with the writer returned by get_conn.
+    """
+    readers = queue.Queue()
+    for _ in range(os.cpu_count() or 4):
+        readers.put(create_readonly_connection(db_file))
+    return readers
+
+
+@contextmanager
+def borrow_reader(db_file):
+    """Borrow a read-only connection from the pool for the duration of the with block."""
+    readers = get_reader_pool(db_file)
+    conn = readers.get()
+    try:
+        yield conn
+    finally:
+        readers.put(conn)
+
+
+@st.cache_resource
+def get_write_lock():
+    """Return the lock serializing writes on the shared connection."""
+    return threading.Lock()
+
+
 def add_employee(conn, employee_data):
     """Insert a new employee record into the EMPLOYEE table."""
     sql = """ INSERT INTO EMPLOYEE(NAME, SALARY, AGE, GENDER, DESIGNATION, WORKING_HOURS, MONTHLY_LUNCH_BILL, BONUS)
               VALUES(?, ?, ?, ?, ?, ?, ?, ?) """
-    cur = conn.cursor()
     try:
-        cur.execute(sql, employee_data)
-        conn.commit()
+        with get_write_lock(), conn:
+            conn.execute(sql, employee_data)
         return True
     except sqlite3.Error as e:
         st.error(f"Error adding employee: {e}")
         return False
 
 
-def get_all_employees(conn):
-    """Retrieve all data from the EMPLOYEE table."""
-    sql = "SELECT * FROM EMPLOYEE"
-    cur = conn.cursor()
+def add_employees(conn, rows):
+    """
+    Insert several employee records into the EMPLOYEE table in a single transaction.
+    Each row holds NAME, SALARY, AGE, GENDER, DESIGNATION, WORKING_HOURS, MONTHLY_LUNCH_BILL, BONUS.
+    """
+    sql = """ INSERT INTO EMPLOYEE(NAME, SALARY, AGE, GENDER, DESIGNATION, WORKING_HOURS, MONTHLY_LUNCH_BILL, BONUS)
+              VALUES(?, ?, ?, ?, ?, ?, ?, ?) """
     try:
-        cur.execute(sql)
-        rows = cur.fetchall()
-        return rows
+        with get_write_lock(), conn:
+            conn.execute("BEGIN") # The connection is in autocommit mode, so open the transaction explicitly
+            conn.executemany(sql, rows)
+        return True
     except sqlite3.Error as e:
-        st.error(f"Error retrieving data: {e}")
-        return []
+        st.error(f"Error adding employees: {e}")
+        return False
+
+
+def _db_version(conn):
+    """
+    Return a key that changes whenever the database contents change.
+    PRAGMA data_version tracks commits from other connections, total_changes the ones made on conn itself.
+    Both are read under the write lock, so they are never sampled in the middle of a transaction on conn.
+    """
+    with get_write_lock():
+        return conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes
+
+@st.cache_data(max_entries=4)
+def load_roster(db_file, version):
+    """
+    Load the EMPLOYEE table as a DataFrame.
+    version is only used as the cache key, so the table is re-read only after a write.
+    """
+    with borrow_reader(db_file) as conn:
+        return pd.read_sql_query("SELECT * FROM EMPLOYEE", conn)
 
 def delete_employee(conn, employee_id=None, employee_name=None):
     """
     Delete an employee record from the EMPLOYEE table by ID or Name.
     Provide either employee_id or employee_name, but not both.
     """
-    cur = conn.cursor()
     if employee_id is not None:
         sql = "DELETE FROM EMPLOYEE WHERE ID = ?"
         param = (employee_id,)
@@ -82,8 +181,8 @@ def delete_employee(conn, employee_id=None, employee_name=None):
         return False
 
     try:
-        cur.execute(sql, param)
-        conn.commit()
+        with get_write_lock(), conn:
+            cur = conn.execute(sql, param)
         # Check if any row was actually deleted
         if cur.rowcount > 0:
             return True
@@ -102,7 +201,6 @@ def search_employee(conn, employee_id=None, employee_name=None):
     Search for an employee record from the EMPLOYEE table by ID or Name.
     Returns the employee record as a list of tuples, or an empty list if not found.
     """
-    cur = conn.cursor()
     if employee_id is not None:
         sql = "SELECT * FROM EMPLOYEE WHERE ID = ?"
         param = (employee_id,)
@@ -114,26 +212,75 @@ def search_employee(conn, employee_id=None, employee_name=None):
         return []
 
     try:
-        cur.execute(sql, param)
-        rows = cur.fetchall()
-        return rows
+        return conn.execute(sql, param).fetchall()
     except sqlite3.Error as e:
         st.error(f"Error searching employee: {e}")
         return []
 
-def execute_sql_query(sql, db):
-    """Executes a given SQL query against the specified database."""
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
+def execute_sql_query(sql, conn):
+    """
+    Executes a given DML query (INSERT, UPDATE, DELETE) on the shared connection under the write lock.
+    Returns the number of rows affected.
+    """
     try:
-        cur.execute(sql)
-        rows = cur.fetchall()
-        conn.commit() # Commit changes for DML operations (INSERT, UPDATE, DELETE)
-        return rows
+        with get_write_lock(), conn:
+            return conn.execute(sql).rowcount
     except sqlite3.Error as e:
         return f"Error executing SQL query: {e}"
-    finally:
-        conn.close()
+
+def validate_ai_sql(sql, allow_dml=True, max_rows=MAX_AI_ROWS):
+    """
+    Parse an AI-generated query and check that it is a single statement touching only the EMPLOYEE table.
+    SELECT (alone or combined with UNION, INTERSECT or EXCEPT) is always allowed, INSERT, UPDATE and DELETE only if allow_dml is True.
+    Returns the query to execute, with a LIMIT added to a SELECT that has none, and whether it is a SELECT.
+    Raises ValueError if the query is rejected.
+    """
+    try:
+        # A trailing "; -- comment" parses as an extra Semicolon node, which is not a statement
+        statements = [statement for statement in sqlglot.parse(sql, read="sqlite")
+                      if statement is not None and not isinstance(statement, exp.Semicolon)]
+    except sqlglot.errors.SqlglotError as e: # ParseError, or TokenError for unbalanced quotes and comments
+        raise ValueError(f"The AI returned invalid SQL: {e}")
+    if len(statements) != 1:
+        raise ValueError("The AI must return exactly one SQL statement.")
+
+    tree = statements[0]
+    # UNION, INTERSECT and EXCEPT of SELECTs are read queries too
+    is_select = isinstance(tree, (exp.Select, exp.Union, exp.Intersect, exp.Except))
+    if not is_select and not (allow_dml and isinstance(tree, (exp.Insert, exp.Update, exp.Delete))):
+        allowed = "SELECT, INSERT, UPDATE or DELETE" if allow_dml else "SELECT"
+        raise ValueError(f"The AI may only run {allowed} queries.")
+
+    cte_names = {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+    tables = {table.name.upper() for table in tree.find_all(exp.Table)} - cte_names
+    if not tables <= {"EMPLOYEE"}:
+        raise ValueError(f"The AI may only query the EMPLOYEE table, not: {', '.join(sorted(tables - {'EMPLOYEE'}))}.")
+
+    if is_select and tree.args.get("limit") is None:
+        tree = tree.limit(max_rows)
+    return tree.sql(dialect="sqlite"), is_select
+
+def run_select(sql, db_file, max_rows=MAX_AI_ROWS):
+    """
+    Executes a SELECT query on a pooled read-only connection and returns at most max_rows rows as a DataFrame.
+    Rows are read in chunks straight into pandas, without an intermediate list of tuples.
+    """
+    chunks = []
+    row_count = 0
+    try:
+        with borrow_reader(db_file) as conn:
+            chunk_iter = pd.read_sql_query(sql, conn, chunksize=5000)
+            try:
+                for chunk in chunk_iter:
+                    chunks.append(chunk)
+                    row_count += len(chunk)
+                    if row_count >= max_rows:
+                        break
+            finally:
+                chunk_iter.close() # Finish the statement before the connection goes back to the pool
+        return pd.concat(chunks, ignore_index=True).head(max_rows)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        return f"Error executing SQL query: {e}"
 
 # Prompt for the LLM
 prompt_text = """
@@ -153,218 +300,334 @@ prompt_text = """
     the SQL command will be something like this SELECT * FROM EMPLOYEE WHERE AGE > 30 AND BONUS > 0;
 """
 
-def get_llm_response(question, system_prompt, max_retries=10, initial_delay=2): # Increased retries and initial delay
+def extract_sql(response):
+    """Return the SQL in an LLM response: the ```sql block if there is one, otherwise the whole response."""
+    sql_match = _SQL_BLOCK_RE.search(response)
+    if sql_match:
+        return sql_match.group(1).strip()
+    # Fallback if no markdown block is found, assume the whole response is the SQL
+    return response.strip()
+
+def is_read_only_response(response):
+    """Return True if the LLM response holds a single valid read-only query."""
+    sql = extract_sql(response)
+    if not _SQL_VERB_RE.match(sql):
+        return False # Prose answers are not worth parsing
+    try:
+        return validate_ai_sql(sql)[1]
+    except ValueError:
+        return False
+
+def get_llm_response(question, system_prompt, use_cache=True):
     """
     Gets an SQL query from the LLM based on the user's question and a system prompt.
-    Uses litellm for API calls with exponential backoff.
+    Identical prompts are answered from the exact-match cache, and similar questions
+    from the semantic cache, unless use_cache is False.
+    The semantic cache only holds read-only queries, so a similar question never replays a data change.
     """
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": question}
-    ]
-    retries = 0
-    delay = initial_delay
-    while retries < max_retries:
+    if not use_cache:
         try:
-            with st.spinner(f"Asking AI... (Attempt {retries + 1}/{max_retries})"): # Add spinner
-                response = completion(
-                    model="openrouter/moonshotai/kimi-k2:free", # Specify the model for LiteLLM
-                    messages=messages,
-                    api_key=os.getenv("OPENROUTER_API_KEY") # Use the OpenRouter API key
-                )
-            return response.choices[0].message.content
-        except RateLimitError as e:
-            retries += 1
-            if retries < max_retries:
-                st.warning(f"Rate limit hit. Retrying in {delay} seconds... (Attempt {retries}/{max_retries})")
-                time.sleep(delay)
-                delay *= 2 # Exponential backoff
-            else:
-                st.error(f"Max retries reached. Error getting response from LLM: {e}")
-                return f"Error: Could not get response from LLM after multiple retries. Details: {e}"
-        except Exception as e:
-            st.error(f"Error getting response from LLM: {e}")
-            return f"Error: Could not get response from LLM. Details: {e}"
-    return "Error: Failed to get LLM response." # Should not be reached if max_retries is handled
+            return cached_completion.__wrapped__(question, system_prompt)
+        except LLMResponseError as e:
+            return str(e)
+
+    key = cache_key(question, system_prompt)
+    cached_response = load_response_cache().get(key)
+    if cached_response is not None:
+        return cached_response
+
+    semantic_cache = get_semantic_cache(database)
+    embedding = semantic_cache.embed(question)
+    cached_response = semantic_cache.lookup(embedding, question)
+    if cached_response is not None and is_read_only_response(cached_response):
+        return cached_response
+
+    try:
+        response = cached_completion(question, system_prompt)
+    except LLMResponseError as e:
+        return str(e)
+    if "Error:" not in response:
+        store_response(key, response)
+        if is_read_only_response(response):
+            semantic_cache.store(embedding, question, response)
+    return response
 
 
 # --- Streamlit App UI and Logic ---
+# Each section is a fragment, so submitting one form only reruns that section.
+# Static headers are emitted by main(), outside the fragments, so fragment reruns don't resend them.
+# After a write the whole app is rerun so the roster shows the change; the success
+# message is carried over to that run through st.session_state.
+
+def show_flash(key):
+    """Display and clear the success message stored under key, if any."""
+    message = st.session_state.pop(key, None)
+    if message:
+        st.success(message)
+
+def rerun_with_flash(key, message):
+    """Store a success message under key and rerun the whole app."""
+    st.session_state[key] = message
+    st.rerun()
+
+def set_action(action):
+    """Form submit callback: record which form was submitted."""
+    st.session_state["_last_action"] = action
+
+def pop_action(action):
+    """Return True, and clear the record, if action is the form submitted on this run."""
+    if st.session_state.get("_last_action") != action:
+        return False
+    del st.session_state["_last_action"]
+    return True
+
+
+# --- Add employee functionality ---
+@st.fragment
+def add_employee_fragment(conn):
+    """Render the form for adding a single employee."""
+    show_flash("add_employee_flash")
+    # Use a Streamlit form for better input management
+    with st.form("new_employee_form"):
+        st.write("Fill in the details for the new employee. **Required fields are marked with an asterisk (*)**")
+
+        # Form input fields
+        col1, col2 = st.columns(2)
+        with col1:
+            name = st.text_input("Name *", key="name_input")
+            salary = st.number_input("Salary", min_value=0.0, step=1000.0, key="salary_input")
+            age = st.number_input("Age", min_value=18, step=1, key="age_input")
+            gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="gender_input")
+
+        with col2:
+            designation = st.text_input("Designation *", key="designation_input")
+            working_hours = st.number_input("Working Hours", min_value=0, step=1, key="hours_input")
+            lunch_bill = st.number_input("Monthly Lunch Bill", min_value=0.0, step=10.0, key="lunch_bill_input")
+            bonus = st.number_input("Bonus", min_value=0.0, step=100.0, key="bonus_input")
+
+        st.form_submit_button("Add Employee", on_click=set_action, args=("add",))
+
+    if pop_action("add"):
+        # Basic validation
+        if not name or not designation:
+            st.warning("Please fill out the required fields: Name and Designation.")
+        else:
+            employee_data = (name, salary, age, gender, designation, working_hours, lunch_bill, bonus)
+            if add_employee(conn, employee_data):
+                rerun_with_flash("add_employee_flash", f"Employee '{name}' added successfully!")
+            else:
+                st.error("Failed to add employee. Check the console for details.")
 
-st.set_page_config(page_title="Employee Data Management", layout="wide")
-st.title("Employee Data Management")
-st.subheader("Add a New Employee Record")
 
-# Create a connection to the database
-database = "company.db"
+# --- Bulk import functionality ---
+@st.fragment
+def import_employees_fragment(conn):
+    """Render the CSV upload for adding employees in bulk."""
+    show_flash("import_employees_flash")
+    with st.form("import_employees_form"):
+        st.write("Upload a CSV file with the columns NAME, SALARY, AGE, GENDER, DESIGNATION, WORKING_HOURS, MONTHLY_LUNCH_BILL and BONUS.")
+        employee_csv = st.file_uploader("CSV file", type="csv", key="employee_csv_input")
+        st.form_submit_button("Import Employees", on_click=set_action, args=("import",))
 
-conn = create_connection(database)
+    if not pop_action("import"):
+        return
+    if employee_csv is None:
+        st.warning("Please upload a CSV file to import.")
+        return
 
-if conn:
     try:
-        # Use a Streamlit form for better input management
-        with st.form("new_employee_form"):
-            st.write("Fill in the details for the new employee. **Required fields are marked with an asterisk (*)**")
-
-            # Form input fields
-            col1, col2 = st.columns(2)
-            with col1:
-                name = st.text_input("Name *", key="name_input")
-                salary = st.number_input("Salary", min_value=0.0, step=1000.0, key="salary_input")
-                age = st.number_input("Age", min_value=18, step=1, key="age_input")
-                gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="gender_input")
-
-            with col2:
-                designation = st.text_input("Designation *", key="designation_input")
-                working_hours = st.number_input("Working Hours", min_value=0, step=1, key="hours_input")
-                lunch_bill = st.number_input("Monthly Lunch Bill", min_value=0.0, step=10.0, key="lunch_bill_input")
-                bonus = st.number_input("Bonus", min_value=0.0, step=100.0, key="bonus_input")
-
-            submit_button = st.form_submit_button("Add Employee")
-
-        if submit_button:
-            # Basic validation
-            if not name or not designation:
-                st.warning("Please fill out the required fields: Name and Designation.")
+        df_import = pd.read_csv(employee_csv)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+        st.warning(f"Could not read the CSV file: {e}")
+        return
+
+    import_columns = list(EMPLOYEE_COLS[1:]) # Every column except the generated ID
+    missing_columns = [column for column in import_columns if column not in df_import.columns]
+    if missing_columns:
+        st.warning(f"The CSV file is missing the columns: {', '.join(missing_columns)}.")
+        return
+    if df_import.empty:
+        st.warning("The CSV file contains no employees.")
+        return
+
+    df_import = df_import[import_columns]
+    # Same required fields as the single-employee form
+    required = df_import[["NAME", "DESIGNATION"]]
+    blank_rows = required.isna().any(axis=1) | required.astype(str).apply(lambda column: column.str.strip() == "").any(axis=1)
+    if blank_rows.any():
+        lines = ", ".join(str(i + 2) for i in df_import.index[blank_rows]) # Line 1 is the header
+        st.warning(f"Name and Designation are required. Fix the CSV lines: {lines}. No records were added.")
+        return
+
+    # Empty cells become NULL instead of NaN
+    df_import = df_import.astype(object).where(df_import.notna(), None)
+    if add_employees(conn, df_import.itertuples(index=False, name=None)):
+        rerun_with_flash("import_employees_flash", f"Imported {len(df_import)} employees successfully!")
+    else:
+        st.error("Failed to import employees. No records were added.")
+
+# --- Delete employee functionality ---
+@st.fragment
+def delete_employee_fragment(conn):
+    """Render the form for removing an employee."""
+    show_flash("delete_employee_flash")
+    with st.form("delete_employee_form"):
+        st.write("Choose how to identify the employee you wish to remove.")
+        delete_by_option = st.radio("Delete by:", ("ID", "Name"), key="delete_by_option")
+
+        employee_id_to_delete = None
+        employee_name_to_delete = None
+
+        if delete_by_option == "ID":
+            employee_id_to_delete = st.number_input("Employee ID", min_value=1, step=1, key="employee_id_to_delete")
+        else: # delete_by_option == "Name"
+            employee_name_to_delete = st.text_input("Employee Name", key="employee_name_to_delete")
+
+        st.form_submit_button("Remove Employee", on_click=set_action, args=("delete",))
+
+    if pop_action("delete"):
+        if delete_by_option == "ID" and employee_id_to_delete:
+            if delete_employee(conn, employee_id=employee_id_to_delete):
+                rerun_with_flash("delete_employee_flash", f"Employee with ID '{employee_id_to_delete}' removed successfully!")
+        elif delete_by_option == "Name" and employee_name_to_delete:
+            if delete_employee(conn, employee_name=employee_name_to_delete):
+                rerun_with_flash("delete_employee_flash", f"Employee with Name '{employee_name_to_delete}' removed successfully!")
+        else:
+            st.warning("Please provide a value for deletion.")
+
+
+# --- Search employee functionality ---
+@st.fragment
+def search_employee_fragment(conn):
+    """Render the form for searching an employee."""
+    with st.form("search_employee_form"):
+        st.write("Choose how to search for an employee.")
+        search_by_option = st.radio("Search by:", ("ID", "Name"), key="search_by_option_search") # Changed key to avoid conflict
+
+        employee_id_to_search = None
+        employee_name_to_search = None
+
+        if search_by_option == "ID":
+            employee_id_to_search = st.number_input("Employee ID", min_value=1, step=1, key="employee_id_to_search")
+        else: # search_by_option == "Name"
+            employee_name_to_search = st.text_input("Employee Name", key="employee_name_to_search")
+
+        st.form_submit_button("Search Employee", on_click=set_action, args=("search",))
+
+    if pop_action("search"):
+        search_results = []
+        if search_by_option == "ID" and employee_id_to_search:
+            search_results = search_employee(conn, employee_id=employee_id_to_search)
+        elif search_by_option == "Name" and employee_name_to_search:
+            search_results = search_employee(conn, employee_name=employee_name_to_search)
+        else:
+            st.warning("Please provide a value for search.")
+
+        if search_results:
+            st.subheader("Search Results:")
+            df_search = pd.DataFrame(search_results, columns=EMPLOYEE_COLS)
+            st.dataframe(df_search, use_container_width=True)
+        else:
+            st.info("No employee found matching your search criteria.")
+
+
+# --- AI Query Functionality ---
+@st.fragment
+def ai_query_fragment(conn, use_cache, allow_dml):
+    """Render the form for asking the AI about employee data."""
+    show_flash("ai_query_flash")
+    with st.form("ai_query_form"):
+        ai_question = st.text_area("Enter your question about employee data:", key="ai_question_input")
+        st.form_submit_button("Ask AI", on_click=set_action, args=("ai",))
+
+    if not pop_action("ai"):
+        return
+    if not ai_question:
+        st.warning("Please enter a question for the AI.")
+        return
+
+    st.info("Getting answer from AI...")
+    response_from_llm = get_llm_response(ai_question, prompt_text, use_cache=use_cache)
+
+    # Attempt to extract SQL from the LLM's response.
+    sql_query_to_execute = extract_sql(response_from_llm)
+
+    if sql_query_to_execute.startswith("Error:"):
+        st.error(sql_query_to_execute)
+    elif not _SQL_VERB_RE.match(sql_query_to_execute):
+        st.warning("The AI did not return a valid SQL query (must start with SELECT, INSERT, UPDATE, or DELETE). Please refine your question.")
+    else:
+        try:
+            sql_query_to_execute, is_select = validate_ai_sql(sql_query_to_execute, allow_dml=allow_dml)
+        except ValueError as e:
+            st.warning(f"{e} Please refine your question.")
+            return
+
+        if is_select:
+            df_ai_results = run_select(sql_query_to_execute, database)
+
+            if isinstance(df_ai_results, str):
+                st.error(df_ai_results)
             else:
-                employee_data = (name, salary, age, gender, designation, working_hours, lunch_bill, bonus)
-                if add_employee(conn, employee_data):
-                    st.success(f"Employee '{name}' added successfully!")
+                st.subheader("AI Answer:")
+                if not df_ai_results.empty:
+                    # If it's a single value (e.g., COUNT, AVG, or specific salary), display it directly
+                    if df_ai_results.shape == (1, 1):
+                        st.success(f"The answer is: **{df_ai_results.iat[0, 0]}**")
+                    elif len(df_ai_results) <= SMALL_RESULT_ROWS and df_ai_results.shape[1] <= SMALL_RESULT_COLS:
+                        st.table(df_ai_results)
+                    else:
+                        # Otherwise, display as a DataFrame
+                        st.dataframe(df_ai_results, use_container_width=True)
                 else:
-                    st.error("Failed to add employee. Check the console for details.")
+                    st.info("No data found for your AI query.")
+        else:
+            result = execute_sql_query(sql_query_to_execute, conn)
 
-        # --- Delete employee functionality ---
-        st.subheader("Remove an Employee Record")
-        with st.form("delete_employee_form"):
-            st.write("Choose how to identify the employee you wish to remove.")
-            delete_by_option = st.radio("Delete by:", ("ID", "Name"), key="delete_by_option")
-
-            employee_id_to_delete = None
-            employee_name_to_delete = None
-
-            if delete_by_option == "ID":
-                employee_id_to_delete = st.number_input("Employee ID", min_value=1, step=1, key="employee_id_to_delete")
-            else: # delete_by_option == "Name"
-                employee_name_to_delete = st.text_input("Employee Name", key="employee_name_to_delete")
-
-            delete_button = st.form_submit_button("Remove Employee")
-
-        if delete_button:
-            if delete_by_option == "ID" and employee_id_to_delete:
-                if delete_employee(conn, employee_id=employee_id_to_delete):
-                    st.success(f"Employee with ID '{employee_id_to_delete}' removed successfully!")
-            elif delete_by_option == "Name" and employee_name_to_delete:
-                if delete_employee(conn, employee_name=employee_name_to_delete):
-                    st.success(f"Employee with Name '{employee_name_to_delete}' removed successfully!")
+            if isinstance(result, str):
+                st.error(result)
+            elif result == 0:
+                st.warning("The query did not change any rows.")
             else:
-                st.warning("Please provide a value for deletion.")
+                rerun_with_flash("ai_query_flash", f"The query was executed successfully: {result} row{'s' if result != 1 else ''} affected.")
 
-        # --- Search employee functionality ---
-        st.subheader("Search Employee Record")
-        with st.form("search_employee_form"):
-            st.write("Choose how to search for an employee.")
-            search_by_option = st.radio("Search by:", ("ID", "Name"), key="search_by_option_search") # Changed key to avoid conflict
-
-            employee_id_to_search = None
-            employee_name_to_search = None
-
-            if search_by_option == "ID":
-                employee_id_to_search = st.number_input("Employee ID", min_value=1, step=1, key="employee_id_to_search")
-            else: # search_by_option == "Name"
-                employee_name_to_search = st.text_input("Employee Name", key="employee_name_to_search")
-
-            search_button = st.form_submit_button("Search Employee")
-
-        if search_button:
-            search_results = []
-            if search_by_option == "ID" and employee_id_to_search:
-                search_results = search_employee(conn, employee_id=employee_id_to_search)
-            elif search_by_option == "Name" and employee_name_to_search:
-                search_results = search_employee(conn, employee_name=employee_name_to_search)
-            else:
-                st.warning("Please provide a value for search.")
-
-            if search_results:
-                st.subheader("Search Results:")
-                columns = ["ID", "NAME", "SALARY", "AGE", "GENDER", "DESIGNATION", "WORKING_HOURS", "MONTHLY_LUNCH_BILL",
-                           "BONUS"]
-                df_search = pd.DataFrame(search_results, columns=columns)
-                st.dataframe(df_search, use_container_width=True)
-            else:
-                st.info("No employee found matching your search criteria.")
 
-        # --- AI Query Functionality ---
-        st.subheader("Ask AI about Employee Data")
-        with st.form("ai_query_form"):
-            ai_question = st.text_area("Enter your question about employee data:", key="ai_question_input")
-            ask_ai_button = st.form_submit_button("Ask AI")
-
-        if ask_ai_button and ai_question:
-            st.info("Getting answer from AI...")
-            response_from_llm = get_llm_response(ai_question, prompt_text)
-
-            # Attempt to extract SQL from the LLM's response.
-            sql_match = re.search(r"```sql\s*(.*?)\s*```", response_from_llm, re.DOTALL | re.IGNORECASE)
-            if sql_match:
-                sql_query_to_execute = sql_match.group(1).strip()
-            else:
-                # Fallback if no markdown block is found, assume the whole response is the SQL
-                sql_query_to_execute = response_from_llm.strip()
-
-            if "Error: Could not get response from LLM" in sql_query_to_execute:
-                st.error(sql_query_to_execute)
-            elif not (sql_query_to_execute.lower().startswith("select") or \
-                      sql_query_to_execute.lower().startswith("insert") or \
-                      sql_query_to_execute.lower().startswith("update") or \
-                      sql_query_to_execute.lower().startswith("delete")):
-                st.warning("The AI did not return a valid SQL query (must start with SELECT, INSERT, UPDATE, or DELETE). Please refine your question.")
-            else:
-                data = execute_sql_query(sql_query_to_execute, "company.db")
+# --- Display all employees in a table ---
+@st.fragment
+def roster_fragment(conn):
+    """Render the table of all employees."""
+    df = load_roster(database, _db_version(conn))
+    if not df.empty:
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.info("The employee table is currently empty.")
 
-                if "Error executing SQL query" in str(data):
-                    st.error(data)
-                else:
-                    st.subheader("AI Answer:")
-                    if data:
-                        # If it's a single value (e.g., COUNT, AVG, or specific salary), display it directly
-                        if len(data) == 1 and len(data[0]) == 1:
-                            st.success(f"The answer is: **{data[0][0]}**")
-                        else:
-                            # Otherwise, display as a DataFrame
-                            columns = ["ID", "NAME", "SALARY", "AGE", "GENDER", "DESIGNATION", "WORKING_HOURS", "MONTHLY_LUNCH_BILL", "BONUS"]
-                            # Attempt to infer columns if it's a SELECT * or a simple query
-                            if sql_query_to_execute.lower().startswith("select * from employee"):
-                                df_ai_results = pd.DataFrame(data, columns=columns)
-                            elif len(data) > 0 and isinstance(data[0], tuple):
-                                # Attempt to create generic columns if specific ones aren't known
-                                # This is a fallback if the AI returns a subset of columns or aggregation
-                                inferred_columns = [f"Column_{i+1}" for i in range(len(data[0]))]
-                                df_ai_results = pd.DataFrame(data, columns=inferred_columns)
-                            else:
-                                # Handle cases where data might be a single value (e.g., COUNT, AVG)
-                                df_ai_results = pd.DataFrame(data)
-
-                            st.dataframe(df_ai_results, use_container_width=True)
-                    else:
-                        st.info("No data found for your AI query.")
-        elif ask_ai_button and not ai_question:
-            st.warning("Please enter a question for the AI.")
 
+def main():
+    """Render the app for an authenticated user."""
+    st.set_page_config(page_title="Employee Data Management", layout="wide")
+    st.title("Employee Data Management")
+    use_semantic_cache = not st.sidebar.checkbox("Disable AI answer cache", value=False, key="no_cache_option")
+    allow_ai_dml = st.sidebar.checkbox("Allow AI to modify data", value=True, key="allow_ai_dml_option")
 
-        # --- Display all employees in a table ---
-        st.subheader("Current Employee Roster")
+    conn = get_conn(database)
 
-        employee_rows = get_all_employees(conn)
-        if employee_rows:
-            columns = ["ID", "NAME", "SALARY", "AGE", "GENDER", "DESIGNATION", "WORKING_HOURS", "MONTHLY_LUNCH_BILL",
-                       "BONUS"]
-            df = pd.DataFrame(employee_rows, columns=columns)
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("The employee table is currently empty.")
-    finally:
-        # Always close the connection
-        conn.close()
-else:
-    st.error("Could not connect to the database. Please ensure 'company.db' exists.")
+    if conn:
+        st.subheader("Add a New Employee Record")
+        add_employee_fragment(conn)
+        st.subheader("Import Employees from CSV")
+        import_employees_fragment(conn)
+        st.subheader("Remove an Employee Record")
+        delete_employee_fragment(conn)
+        st.subheader("Search Employee Record")
+        search_employee_fragment(conn)
+        st.subheader("Ask AI about Employee Data")
+        ai_query_fragment(conn, use_semantic_cache, allow_ai_dml)
+        st.subheader("Current Employee Roster")
+        roster_fragment(conn)
+    else:
+        get_conn.clear() # Don't keep a failed connection cached
+        st.error("Could not connect to the database. Please ensure 'company.db' exists.")
 
 
+main()
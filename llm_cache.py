@@ -0,0 +1,82 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import streamlit as st
+from litellm import acompletion
+
+# --- Exact-Match Cache for LLM Responses ---
+# Lives in its own module because the Streamlit script is re-executed on every
+# rerun, which would throw away an lru_cache defined there.
+
+LLM_MODEL = "openrouter/moonshotai/kimi-k2:free"
+MAX_RETRIES = 10
+LLM_TIMEOUT = 120 # Seconds per request
+RESPONSE_CACHE_FILE = os.path.join(".cache", "llm_responses.json")
+
+# Serializes updates of the shared response cache and its file across sessions
+_store_lock = threading.Lock()
+
+
+class LLMResponseError(Exception):
+    """Raised when no response could be obtained from the LLM."""
+
+
+def cache_key(question, system_prompt):
+    """Return the SHA256 key identifying a (question, system_prompt) pair."""
+    payload = json.dumps({"q": question, "p": system_prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@st.cache_resource
+def load_response_cache(path=RESPONSE_CACHE_FILE):
+    """Load the on-disk response cache once per process. Returns an empty dict if the file is missing or unreadable."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def store_response(key, response, path=RESPONSE_CACHE_FILE):
+    """
+    Add a response to the in-memory cache and write the cache back to disk.
+    The file is replaced atomically, so a crash mid-write never leaves invalid JSON behind.
+    """
+    with _store_lock:
+        responses = load_response_cache(path)
+        responses[key] = response
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(responses, f)
+        os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=512)
+def cached_completion(question, system_prompt):
+    """
+    Gets the LLM response for the question and system prompt, memoized on both strings.
+    Retries are left to litellm, which backs off exponentially on rate limits.
+    Raises LLMResponseError on failure so that errors are never cached.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+    try:
+        with st.spinner("Asking AI..."):
+            response = asyncio.run(acompletion(
+                model=LLM_MODEL, # Specify the model for LiteLLM
+                messages=messages,
+                api_key=os.getenv("OPENROUTER_API_KEY"), # Use the OpenRouter API key
+                num_retries=MAX_RETRIES,
+                timeout=LLM_TIMEOUT
+            ))
+        return response.choices[0].message.content
+    except Exception as e:
+        st.error(f"Error getting response from LLM: {e}")
+        raise LLMResponseError(f"Error: Could not get response from LLM. Details: {e}")
@@ -0,0 +1,148 @@
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import streamlit as st
+
+# --- Semantic Cache for LLM Responses ---
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+SIMILARITY_THRESHOLD = 0.92
+
+# Numbers and quoted strings in a question; a cached answer is only reused if they match exactly
+_LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?")
+
+
+def question_literals(question):
+    """Return the numbers and quoted strings in the question, which embeddings barely tell apart."""
+    return sorted(_LITERAL_RE.findall(question))
+
+
+@st.cache_resource
+def get_embedder():
+    """
+    Load the sentence-embedding model once per process.
+    sentence_transformers (and torch) are imported here, so they are only loaded when the cache is first used.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+    return SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+
+
+def embeddings_path(db_file):
+    """Return the .npy file holding the embedding matrix for db_file, e.g. company_embeddings.npy."""
+    return f"{os.path.splitext(db_file)[0]}_embeddings.npy"
+
+
+def save_embeddings(db_file, embeddings):
+    """
+    Write the embedding matrix for db_file.
+    The file is replaced atomically, so matrices that are still memory-mapped keep their old contents.
+    """
+    path = embeddings_path(db_file)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_path, path)
+
+
+def rebuild_embeddings(db_file):
+    """
+    Rebuild the embedding matrix from the BLOBs in the QUERY_CACHE table and save it to disk.
+    Returns the matrix together with the questions and responses read in the same query, so they always line up.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute("SELECT embedding, question, sql FROM QUERY_CACHE ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    embeddings = np.empty((len(rows), EMBEDDING_DIM), dtype=np.float32)
+    for i, row in enumerate(rows):
+        embeddings[i] = np.frombuffer(row[0], dtype=np.float32)
+    save_embeddings(db_file, embeddings)
+    return embeddings, [row[1] for row in rows], [row[2] for row in rows]
+
+
+@st.cache_resource(ttl=60)
+def load_cached_entries(db_file):
+    """
+    Load the embedding matrix and the cached questions and responses for db_file.
+    The matrix is memory-mapped from the .npy file, one L2-normalised float32 row per
+    QUERY_CACHE row in rowid order. It is rebuilt from the table if the file is missing or stale.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute("SELECT question, sql FROM QUERY_CACHE ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    try:
+        embeddings = np.load(embeddings_path(db_file), mmap_mode="r")
+    except (OSError, ValueError):
+        embeddings = None
+    if embeddings is None or embeddings.shape != (len(rows), EMBEDDING_DIM):
+        return rebuild_embeddings(db_file)
+    return embeddings, [row[0] for row in rows], [row[1] for row in rows]
+
+
+class SemanticCache:
+    """
+    Caches LLM responses keyed by the embedding of the question, so paraphrased
+    questions are answered from the database instead of calling the LLM again.
+    """
+
+    def __init__(self, db_file, threshold=SIMILARITY_THRESHOLD):
+        self.db_file = db_file
+        self.threshold = threshold
+        conn = sqlite3.connect(db_file)
+        try:
+            conn.execute(""" CREATE TABLE IF NOT EXISTS QUERY_CACHE(
+                                 embedding BLOB, question TEXT, sql TEXT, ts REAL) """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def embed(self, question):
+        """Return the L2-normalised embedding of the question."""
+        return get_embedder().encode(question, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def lookup(self, embedding, question):
+        """
+        Return the cached response of the most similar question, or None if nothing is close enough.
+        A match is only used if it mentions the same numbers and quoted strings as the question.
+        """
+        cached, questions, responses = load_cached_entries(self.db_file)
+        if not responses:
+            return None
+        # A single matrix-vector product scores every cached question at once
+        sims = cached @ embedding
+        candidates = np.flatnonzero(sims >= self.threshold)
+        literals = question_literals(question)
+        for i in candidates[np.argsort(-sims[candidates], kind="stable")]:
+            if question_literals(questions[i]) == literals:
+                return responses[i]
+        return None
+
+    def store(self, embedding, question, response):
+        """Persist a new (embedding, question, response) entry and append it to the embedding matrix."""
+        embedding = embedding.astype(np.float32)
+        cached, _, _ = load_cached_entries(self.db_file)
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute("INSERT INTO QUERY_CACHE(embedding, question, sql, ts) VALUES(?, ?, ?, ?)",
+                         (embedding.tobytes(), question, response, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        save_embeddings(self.db_file, np.vstack([cached, embedding[np.newaxis, :]]))
+        load_cached_entries.clear()
+
+
+@st.cache_resource
+def get_semantic_cache(db_file):
+    """Create the SemanticCache for db_file once per process."""
+    return SemanticCache(db_file)